@@ -0,0 +1,74 @@
+"""
+Import Time Benchmark
+
+This script is part of ITest framework.
+
+Measures the startup cost of the ITest libraries. Every sample imports a library in a fresh
+interpreter, so the numbers match what a short-lived test process pays. The script fails when
+the median import time exceeds the budget or when a heavy backend is loaded at import time.
+
+Usage:
+    python benchmark/import_time.py [--runs N]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Library: (directory, startup budget in seconds, modules that must not be loaded by the import)
+IMPORT_BUDGET = {
+    'report': ('report', 0.050, ['jinja2', 'lxml']),
+    'trace32': ('trace32', 0.050, ['lauterbach', 'numpy']),
+}
+
+PROBE = '''
+import sys, time
+sys.path.insert(0, {path!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, ','.join(m for m in {lazy!r} if m in sys.modules))
+'''
+
+
+def measure(module, path, lazy, runs):
+    """
+    Import a module in fresh interpreters.
+
+    @return: (median import time in seconds, list of heavy modules that were loaded)
+    """
+    samples = []
+    loaded = set()
+    for _ in range(runs):
+        code = PROBE.format(path=path, module=module, lazy=lazy)
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        elapsed, _, modules = out.stdout.strip().partition(' ')
+        samples.append(float(elapsed))
+        loaded.update(m for m in modules.split(',') if m)
+    return statistics.median(samples), sorted(loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ITest libraries import time benchmark')
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters per library')
+    args = parser.parse_args()
+
+    failed = False
+    for module, (folder, budget, lazy) in IMPORT_BUDGET.items():
+        median, loaded = measure(module, os.path.join(ROOT_DIR, folder), lazy, args.runs)
+        status = 'OK'
+        if median > budget or loaded:
+            status = 'NOK'
+            failed = True
+        print(f'{module:10} {median * 1000:8.2f} ms  budget {budget * 1000:6.1f} ms  {status}'
+              + (f'  eagerly loaded: {", ".join(loaded)}' if loaded else ''))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
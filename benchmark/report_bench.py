@@ -0,0 +1,184 @@
+"""
+Report Generation Benchmark
+
+This script is part of ITest framework.
+
+Builds synthetic ITestReport runs of growing size and measures, for every output mode, the time
+spent recording the steps (add_test_step), reading the summary and generating the output, plus
+the peak memory of the process. Every measurement runs in a fresh interpreter so the peak memory
+(max RSS, Linux) belongs to that measurement only. Paged mode renders serially (processes=1) so
+its time and memory compare with the other modes; the peak of any child process is counted too.
+Runs offline, no target hardware needed.
+
+Two checks flag regressions:
+    - scaling: the generation time must grow roughly linearly with the number of steps, an
+      exponent above SCALING_LIMIT between two sizes (e.g. a quadratic pass) is reported
+    - baseline: times and memory are compared with a stored baseline, if one exists
+
+Usage:
+    python benchmark/report_bench.py                        # full run, 10 to 100k steps
+    python benchmark/report_bench.py --sizes 10 1000 --modes html junit
+    python benchmark/report_bench.py --save-baseline        # store the results as baseline
+"""
+
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'report_baseline.json')
+
+# Output modes: 'html' in memory, 'stream' result log, 'paged' multi-file, 'junit' and 'json' emitters
+MODES = ['html', 'stream', 'paged', 'junit', 'json']
+SIZES = [10, 100, 1000, 10000, 100000]
+COMMENT_SIZES = [16, 1024]
+
+# Test steps in each synthetic test case
+STEPS_PER_CASE = 100
+
+# Maximum growth exponent of the generation time between two sizes (1.0 is linear)
+SCALING_LIMIT = 1.3
+
+# Allowed ratio against the baseline before a measurement is flagged
+BASELINE_TOLERANCE = 1.5
+
+# Below this time (seconds) timing noise dominates and the checks are skipped
+MIN_TIME = 0.05
+
+
+def run_worker(mode, steps, comment_size):
+    """ Build and generate one synthetic report in this process. @return: measurement dictionary """
+    sys.path.insert(0, os.path.join(ROOT_DIR, 'report'))
+    import report
+
+    comment = ('x' * 63 + '\n') * (comment_size // 64) + 'x' * (comment_size % 64)
+    with tempfile.TemporaryDirectory() as out_dir:
+        log_file = os.path.join(out_dir, 'results.jsonl') if mode == 'stream' else None
+        test = report.ITestReport('Benchmark', '1.0.0', '1', 'Benchmark', 'None', log_file=log_file)
+
+        start = time.perf_counter()
+        for step in range(steps):
+            if step % STEPS_PER_CASE == 0:
+                test.add_test_case(f'Test case {step // STEPS_PER_CASE}', 'Synthetic test case')
+            test.add_test_step(f'Step {step}', ('OK', 'NOK', 'NT')[step % 3], comment)
+        record = time.perf_counter() - start
+
+        start = time.perf_counter()
+        test.get_summary()
+        test.get_test_case_summary()
+        summary = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if mode in ('html', 'stream'):
+            test.gen_report(os.path.join(out_dir, 'report.html'))
+        elif mode == 'paged':
+            test.gen_paged_report(os.path.join(out_dir, 'pages'), processes=1)
+        elif mode == 'junit':
+            test.gen_junit(os.path.join(out_dir, 'report.xml'))
+        else:
+            test.gen_json(os.path.join(out_dir, 'report.json'))
+        generate = time.perf_counter() - start
+        test.close()
+
+    return {
+        'mode': mode,
+        'steps': steps,
+        'comment': comment_size,
+        'record': record,
+        'summary': summary,
+        'generate': generate,
+        'rss_mb': max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                      resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024.0,
+    }
+
+
+def measure(mode, steps, comment_size):
+    """ Run one measurement in a fresh interpreter. """
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', mode, str(steps), str(comment_size)],
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+
+def check_scaling(results):
+    """ Return a message for each mode whose generation time grows faster than SCALING_LIMIT. """
+    issues = []
+    series = {}
+    for result in results:
+        series.setdefault((result['mode'], result['comment']), []).append(result)
+    for (mode, comment), points in series.items():
+        points.sort(key=lambda result: result['steps'])
+        for small, large in zip(points, points[1:]):
+            if small['generate'] < MIN_TIME:
+                continue
+            exponent = (math.log(large['generate'] / small['generate'])
+                        / math.log(large['steps'] / small['steps']))
+            if exponent > SCALING_LIMIT:
+                issues.append(f'{mode} (comment {comment} B): generation grows as n^{exponent:.2f} '
+                              f'between {small["steps"]} and {large["steps"]} steps')
+    return issues
+
+
+def check_baseline(results, baseline):
+    """ Return a message for each measurement slower or bigger than the baseline. """
+    issues = []
+    reference = {(b['mode'], b['steps'], b['comment']): b for b in baseline}
+    for result in results:
+        base = reference.get((result['mode'], result['steps'], result['comment']))
+        if base is None:
+            continue
+        for key in ('record', 'generate', 'rss_mb'):
+            if key != 'rss_mb' and base[key] < MIN_TIME:
+                continue
+            if result[key] > base[key] * BASELINE_TOLERANCE:
+                issues.append(f'{result["mode"]} {result["steps"]} steps (comment {result["comment"]} B): '
+                              f'{key} {result[key]:.3f} vs baseline {base[key]:.3f}')
+    return issues
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ITestReport generation benchmark')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES, help='number of test steps')
+    parser.add_argument('--comments', nargs='+', type=int, default=COMMENT_SIZES, help='comment sizes in bytes')
+    parser.add_argument('--save-baseline', action='store_true', help=f'store the results in {BASELINE_FILE}')
+    parser.add_argument('--worker', nargs=3, metavar=('MODE', 'STEPS', 'COMMENT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        mode, steps, comment_size = args.worker
+        print(json.dumps(run_worker(mode, int(steps), int(comment_size))))
+        return
+
+    results = []
+    print(f'{"mode":8} {"steps":>7} {"comment":>8} {"record s":>10} {"summary s":>10} {"generate s":>11} {"peak MB":>8}')
+    for mode in args.modes:
+        for comment_size in args.comments:
+            for steps in sorted(args.sizes):
+                result = measure(mode, steps, comment_size)
+                results.append(result)
+                print(f'{mode:8} {steps:7d} {comment_size:8d} {result["record"]:10.3f} {result["summary"]:10.5f} '
+                      f'{result["generate"]:11.3f} {result["rss_mb"]:8.1f}')
+
+    issues = check_scaling(results)
+    if os.path.exists(BASELINE_FILE) and not args.save_baseline:
+        with open(BASELINE_FILE, 'r') as fp:
+            issues += check_baseline(results, json.load(fp))
+
+    if args.save_baseline:
+        with open(BASELINE_FILE, 'w') as fp:
+            json.dump(results, fp, indent=1)
+        print(f'Baseline saved in {BASELINE_FILE}')
+
+    for issue in issues:
+        print(f'[REGRESSION] {issue}')
+    sys.exit(1 if issues else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -237,7 +237,7 @@
                         <tr>
                             <th>
                                 <p class="t3">
-                                <a href="#{generate-id(NAME)}">
+                                <a href="{@page}#{@id}">
                                     <xsl:value-of select="NAME" />
                                 </a>
                                 </p>
@@ -304,113 +304,120 @@
                 </table>
                 <br />
 
-                <xsl:for-each select="TEST_CASE">
-                    <table id="clean_table" width="1100">
-                        <tr>
-                            <th>
-                                <p class="t12">
-                                	<a name="{generate-id(NAME)}">
-                                    <xsl:value-of select="NAME" />
-                                    </a>
-                                </p>
-                            </th>
-                        </tr>
-                        <tr>
-                        </tr>
-                        <tr>
-                            <th>
-                                <p class="t3">
-                                    <xsl:value-of select="DESCRIPTION" />
-                                </p>
-                            </th>
-                        </tr>
-                        <tr>
-                            <th>
-                                <p class="t3">
-                                    <xsl:value-of select="REQUIREMENT" />
-                                </p>
-                            </th>
-                        </tr>
-                        <tr>
-                            <th>
-                                <p class="t3">
-                                    <xsl:value-of select="INITIAL_CONDITIONS" />
-                                </p>
-                            </th>
-                        </tr>
-                        <tr>
-                            <th>
-                                <p class="t3">
-                                    <xsl:value-of select="ACTIONS" />
-                                </p>
-                            </th>
-                        </tr>
-                        <tr>
-                            <th>
-                                <p class="t3">
-                                    <xsl:value-of select="EVAL_CRITERIA" />
-                                </p>
-                            </th>
-                        </tr>
-                    </table>
-
-                    <table height="30" width="1100">
-                        <col width="775" />
-                        <col width="55" />
-                        <col width="275" />
-                        <tr bgcolor="#D8D8D8">
-                            <th>
-                                <p class="t2">Test Steps</p>
-                            </th>
-                            <th>
-                                <p class="t2">Result</p>
-                            </th>
-                            <th>
-                                <p class="t2">Comments</p>
-                            </th>
-                        </tr>
-                        <xsl:for-each select="TEST_STEP">
-                            <tr>
-                                <td>
-                                    <p class="t3">
-                                        <xsl:call-template name="KeepBreakLines">
-                                            <xsl:with-param name="text" select='NAME' />
-                                        </xsl:call-template>
-                                    </p>
-                                </td>
-                                <xsl:choose>
-                                    <xsl:when test="RESULT = 'NT'">
-                                        <td bgcolor="grey" align="center">
-                                            <p class="t2">NT</p>
-                                        </td>
-                                    </xsl:when>
-                                    <xsl:when test="RESULT = 'OK'">
-                                        <td bgcolor="#53ee95" align="center">
-                                            <p class="t2">OK</p>
-                                        </td>
-                                    </xsl:when>
-                                    <xsl:when test="RESULT = 'NOK'">
-                                        <td bgcolor="#FA5050" align="center">
-                                            <p class="t2">NOK</p>
-                                        </td>
-                                    </xsl:when>
-                                </xsl:choose>
-                                <td>
-                                    <p class="t3">
-                                        <xsl:call-template name="KeepBreakLines">
-                                            <xsl:with-param name="text" select='COMMENTS' />
-                                        </xsl:call-template>
-                                    </p>
-                                </td>
-                            </tr>
-                        </xsl:for-each>
-                    </table>
-                    <br />
-                    <br />
-                </xsl:for-each>
+                <xsl:apply-templates select="TEST_CASE" />
                 <br />
                 <p class="footer">Created with ONE ITest Framework</p>
             </body>
         </html>
     </xsl:template>
+
+    <xsl:template match="TEST_CASE">
+        <table id="clean_table" width="1100">
+            <tr>
+                <th>
+                    <p class="t12">
+                    	<a name="{@id}">
+                        <xsl:value-of select="NAME" />
+                        </a>
+                    </p>
+                </th>
+            </tr>
+            <tr>
+            </tr>
+            <tr>
+                <th>
+                    <p class="t3">
+                        <xsl:value-of select="DESCRIPTION" />
+                    </p>
+                </th>
+            </tr>
+            <tr>
+                <th>
+                    <p class="t3">
+                        <xsl:value-of select="REQUIREMENT" />
+                    </p>
+                </th>
+            </tr>
+            <tr>
+                <th>
+                    <p class="t3">
+                        <xsl:value-of select="INITIAL_CONDITIONS" />
+                    </p>
+                </th>
+            </tr>
+            <tr>
+                <th>
+                    <p class="t3">
+                        <xsl:value-of select="ACTIONS" />
+                    </p>
+                </th>
+            </tr>
+            <tr>
+                <th>
+                    <p class="t3">
+                        <xsl:value-of select="EVAL_CRITERIA" />
+                    </p>
+                </th>
+            </tr>
+        </table>
+
+        <table height="30" width="1100">
+            <col width="775" />
+            <col width="55" />
+            <col width="275" />
+            <tr bgcolor="#D8D8D8">
+                <th>
+                    <p class="t2">Test Steps</p>
+                </th>
+                <th>
+                    <p class="t2">Result</p>
+                </th>
+                <th>
+                    <p class="t2">Comments</p>
+                </th>
+            </tr>
+            <xsl:apply-templates select="TEST_STEP" />
+        </table>
+        <br />
+        <br />
+    </xsl:template>
+
+    <xsl:template match="TEST_STEP">
+        <tr>
+            <td>
+                <p class="t3">
+                    <xsl:call-template name="KeepBreakLines">
+                        <xsl:with-param name="text" select='NAME' />
+                    </xsl:call-template>
+                </p>
+            </td>
+            <xsl:choose>
+                <xsl:when test="RESULT = 'NT'">
+                    <td bgcolor="grey" align="center">
+                        <p class="t2">NT</p>
+                    </td>
+                </xsl:when>
+                <xsl:when test="RESULT = 'OK'">
+                    <td bgcolor="#53ee95" align="center">
+                        <p class="t2">OK</p>
+                    </td>
+                </xsl:when>
+                <xsl:when test="RESULT = 'NOK'">
+                    <td bgcolor="#FA5050" align="center">
+                        <p class="t2">NOK</p>
+                    </td>
+                </xsl:when>
+            </xsl:choose>
+            <td>
+                <p class="t3">
+                    <xsl:call-template name="KeepBreakLines">
+                        <xsl:with-param name="text" select='COMMENTS' />
+                    </xsl:call-template>
+                </p>
+                <xsl:for-each select="PLOT">
+                    <xsl:copy-of select="*" />
+                </xsl:for-each>
+            </td>
+        </tr>
+    </xsl:template>
 </xsl:stylesheet>
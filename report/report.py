@@ -9,12 +9,552 @@ This library is part of ITest framework.
 @change:  JGonzalez - 1.0.0 - Integration test report hith hyperlinks
 """
 
+import array
 import datetime
+import functools
+import hashlib
+import itertools
+import json
 import os
 import re
+import struct
+import threading
+import time
+import zlib
 from collections import defaultdict
-from jinja2 import Template
-from lxml import etree
+
+# jinja2 and lxml are only needed to render the HTML, they are imported in gen_report()
+# so that scripts which only collect results start fast.
+
+REPORT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Number of test steps transformed per XSLT call when rendering a result log
+STREAM_CHUNK = 500
+
+# Style sheet rendering loose TEST_CASE/TEST_STEP elements with the ITestStyle.xsl templates
+CHUNK_XSL = '''<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+    <xsl:import href="ITestStyle.xsl" />
+    <xsl:template match="/CHUNK">
+        <CHUNK><xsl:apply-templates select="*" /></CHUNK>
+    </xsl:template>
+</xsl:stylesheet>'''
+
+# JUnit XML status of each test step result
+JUNIT_STATUS = {'OK': 'pass', 'NOK': 'fail', 'NT': 'skipped'}
+
+# Attachment side-car file header: magic, number of samples, X values present
+ATTACHMENT_HEADER = struct.Struct('<4sQB')
+ATTACHMENT_MAGIC = b'ITSA'
+
+# Size in pixels of the attachment plots, the plots keep a min/max pair per horizontal pixel
+SVG_WIDTH = 260
+SVG_HEIGHT = 80
+
+# Rows buffered by ResultStore before they are inserted in one transaction
+STORE_BATCH = 1000
+
+# Summary counters increased by each test step result: (test case counter, report counter)
+RESULT_COUNTERS = {
+    'OK': ('TEST_OK', 'TOTAL_TEST_OK'),
+    'NOK': ('TEST_KO', 'TOTAL_TEST_KO'),
+    'NT': ('NOT_TESTED', 'TOTAL_NOT_TESTED'),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _load_template():
+    """ Read and compile the Jinja XML template once per process. """
+    from jinja2 import Template
+    with open(os.path.join(REPORT_DIR, 'template.xml'), 'r') as template_file:
+        return Template(template_file.read(), autoescape=True)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_transform():
+    """ Parse and compile the XSL style sheet once per process. """
+    from lxml import etree
+    return etree.XSLT(etree.parse(os.path.join(REPORT_DIR, 'ITestStyle.xsl')))
+
+
+@functools.lru_cache(maxsize=None)
+def _load_chunk_transform():
+    """ Compile the style sheet used to render test cases and test steps one chunk at a time. """
+    from lxml import etree
+    return etree.XSLT(etree.XML(CHUNK_XSL, base_url=os.path.join(REPORT_DIR, 'chunk.xsl')))
+
+
+@functools.lru_cache(maxsize=None)
+def _style_digest():
+    """ Hash of the style sheets that render the report pages, to detect a style change. """
+    with open(os.path.join(REPORT_DIR, 'ITestStyle.xsl'), 'rb') as fp:
+        return hashlib.sha1(fp.read() + CHUNK_XSL.encode()).hexdigest().encode()
+
+
+def _new_summary():
+    """ Report summary with all the totals set to zero. """
+    summary = defaultdict(int)
+    for counter in ['TOTAL_RUN_TEST'] + [total for _, total in RESULT_COUNTERS.values()]:
+        summary[counter] = 0
+    return summary
+
+
+def _new_case_summary(test_case):
+    """ Summary entry of a test case with all the counters set to zero. """
+    case_summary = {'ID': test_case['ID'], 'NAME': test_case['NAME']}
+    for counter, _ in RESULT_COUNTERS.values():
+        case_summary[counter] = 0
+    return case_summary
+
+
+def _count_result(summary, case_summary, result):
+    """ Add a test step result to the test case and report counters. """
+    counter, total = RESULT_COUNTERS[result]
+    case_summary[counter] += 1
+    summary[total] += 1
+    summary['TOTAL_RUN_TEST'] += 1
+
+
+def _escape(text):
+    """ Escape &, < and > for XML text. """
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _quoteattr(text):
+    """ Escape and quote a value for an XML attribute. """
+    return ('"' + _escape(text).replace('"', '&quot;').replace('\n', '&#10;').replace('\r', '&#13;')
+            .replace('\t', '&#9;') + '"')
+
+
+def _write_attachment(file_name, y, x=None):
+    """ Write a numeric series as float64 samples compressed with zlib, never over an existing file. """
+    data = y.tobytes() if x is None else x.tobytes() + y.tobytes()
+    with open(file_name, 'xb') as fp:
+        fp.write(ATTACHMENT_HEADER.pack(ATTACHMENT_MAGIC, len(y), x is not None))
+        fp.write(zlib.compress(data))
+
+
+def read_attachment(file_name):
+    """
+    Read a numeric series attached to a test step.
+
+    @param file_name: FILE of the attachment
+    @return: (x, y) arrays of floats, x is None if the series was attached without X values
+    """
+    with open(file_name, 'rb') as fp:
+        magic, count, has_x = ATTACHMENT_HEADER.unpack(fp.read(ATTACHMENT_HEADER.size))
+        if magic != ATTACHMENT_MAGIC:
+            raise ValueError(f'{file_name} is not an ITest attachment')
+        samples = array.array('d')
+        samples.frombytes(zlib.decompress(fp.read()))
+    if has_x:
+        return samples[:count], samples[count:]
+    return None, samples
+
+
+def _downsample(x, y, buckets):
+    """
+    Reduce a series to at most two points per bucket, the minimum and the maximum of the bucket
+    in the order they occur, so peaks and glitches stay visible after downsampling.
+
+    @return: list of (x, y) points
+    """
+    count = len(y)
+    if count <= 2 * buckets:
+        return [(i if x is None else x[i], y[i]) for i in range(count)]
+    points = []
+    for bucket in range(buckets):
+        start = bucket * count // buckets
+        segment = y[start:(bucket + 1) * count // buckets]
+        low = start + segment.index(min(segment))
+        high = start + segment.index(max(segment))
+        for i in sorted({low, high}):
+            points.append((i if x is None else x[i], y[i]))
+    return points
+
+
+def _svg_plot(label, x, y):
+    """ Render a series as an inline SVG line plot downsampled to SVG_WIDTH buckets. """
+    points = _downsample(x, y, SVG_WIDTH)
+    x_min, x_max = points[0][0], points[-1][0]
+    y_min, y_max = min(y), max(y)
+    x_scale = (SVG_WIDTH - 1) / ((x_max - x_min) or 1)
+    y_scale = (SVG_HEIGHT - 16) / ((y_max - y_min) or 1)
+    polyline = ' '.join(f'{(px - x_min) * x_scale:.1f},{SVG_HEIGHT - 2 - (py - y_min) * y_scale:.1f}'
+                        for px, py in points)
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{SVG_WIDTH}" height="{SVG_HEIGHT}">'
+            f'<rect width="{SVG_WIDTH}" height="{SVG_HEIGHT}" fill="white" stroke="#D8D8D8"/>'
+            f'<polyline fill="none" stroke="#1F4E99" stroke-width="1" points="{polyline}"/>'
+            f'<text x="2" y="11" font-size="10" font-family="Courier New">'
+            f'{_escape(str(label))} [{y_min:.4g} .. {y_max:.4g}] n={len(y)}</text></svg>')
+
+
+def _read_log(log_file):
+    """ Iterate over the records of a result log. @return: (start offset, end offset, record) """
+    with open(log_file, 'rb') as fp:
+        offset = 0
+        for line in fp:
+            end = offset + len(line)
+            if line.strip():
+                yield offset, end, json.loads(line)
+            offset = end
+
+
+def _index_log(log_file):
+    """
+    Read a result log once to build the report data (information and summary) and, for each test
+    case, the byte ranges of its records. Records of the same test case that follow each other
+    share one range, so a sequential log needs one range per test case while the steps of test
+    cases recorded concurrently can still be read back grouped by test case.
+
+    @return: (report data, {test case ID: [[start, end], ...]}) with test cases in creation order
+    """
+    data = {'summary': _new_summary(), 'summary_test_cases': [], 'test_cases': []}
+    cases = {}
+    ranges = {}
+    for offset, end, record in _read_log(log_file):
+        if record['TYPE'] == 'REPORT':
+            data.update((key, value) for key, value in record.items() if key != 'TYPE')
+            continue
+        if record['TYPE'] == 'TEST_CASE':
+            case_id = record['ID']
+            cases[case_id] = _new_case_summary(record)
+            data['summary_test_cases'].append(cases[case_id])
+        else:
+            case_id = record['CASE']
+            _count_result(data['summary'], cases[case_id], record['RESULT'])
+        case_ranges = ranges.setdefault(case_id, [])
+        if case_ranges and case_ranges[-1][1] == offset:
+            case_ranges[-1][1] = end
+        else:
+            case_ranges.append([offset, end])
+    return data, ranges
+
+
+def _read_log_ranges(fp, ranges):
+    """ Iterate over the records stored in the byte ranges of an open result log. """
+    for start, end in ranges:
+        fp.seek(start)
+        while fp.tell() < end:
+            line = fp.readline()
+            if line.strip():
+                yield json.loads(line)
+
+
+def _add_test_step_element(parent, test_step):
+    """ Add a TEST_STEP element, with a PLOT element per attachment, to an XML element. """
+    from lxml import etree
+    step = etree.SubElement(parent, 'TEST_STEP')
+    for key in ITestReport.LOG_FIELDS['TEST_STEP']:
+        etree.SubElement(step, key).text = str(test_step[key])
+    for attachment in test_step.get('ATTACHMENTS', ()):
+        if attachment.get('SVG'):
+            etree.SubElement(step, 'PLOT').append(etree.fromstring(attachment['SVG']))
+
+
+def _render_chunk(records):
+    """
+    Render TEST_CASE/TEST_STEP records with the report style. A TEST_CASE record may carry its
+    steps in a TEST_STEP list. @return: list of HTML elements
+    """
+    from lxml import etree
+    chunk = etree.Element('CHUNK')
+    for record in records:
+        if record['TYPE'] == 'TEST_STEP':
+            _add_test_step_element(chunk, record)
+            continue
+        element = etree.SubElement(chunk, 'TEST_CASE', id=record['ID'])
+        for key in ITestReport.LOG_FIELDS['TEST_CASE']:
+            etree.SubElement(element, key).text = str(record[key])
+        for test_step in record.get('TEST_STEP', ()):
+            _add_test_step_element(element, test_step)
+    return list(_load_chunk_transform()(chunk).getroot())
+
+
+def _read_log_test_cases(log_file, ranges):
+    """ Iterate over the test cases of a result log, each one with its TEST_STEP list. """
+    with open(log_file, 'rb') as fp:
+        for case_ranges in ranges.values():
+            records = _read_log_ranges(fp, case_ranges)
+            test_case = next(records)
+            test_case['TEST_STEP'] = list(records)
+            yield test_case
+
+
+def _write_page(job):
+    """
+    Write one page of a paginated report. Runs in gen_paged_report() or one of its worker processes.
+
+    @param job: (file name, serialized <head> element, list of test cases)
+    """
+    from lxml import etree
+    file_name, head, test_cases = job
+    html = etree.Element('html')
+    html.append(etree.fromstring(head))
+    body = etree.SubElement(html, 'body')
+    link = etree.SubElement(etree.SubElement(body, 'p', {'class': 't3'}), 'a', href='index.html')
+    link.text = 'TEST SUMMARY'
+    etree.SubElement(body, 'br')
+    body.extend(_render_chunk([dict(test_case, TYPE='TEST_CASE') for test_case in test_cases]))
+    etree.SubElement(body, 'p', {'class': 'footer'}).text = 'Created with ONE ITest Framework'
+    with open(file_name, 'w', encoding='utf-8') as fp:
+        fp.write(etree.tostring(html, pretty_print=True, encoding='unicode'))
+
+
+def gen_report_from_log(log_file, file_name='report.html'):
+    """
+    Generate the HTML report from a result log written by ITestReport(log_file=...).
+
+    The log is read twice: once to build the summary and once to render the test cases, which
+    are transformed and written in chunks of STREAM_CHUNK steps. Memory use does not depend on
+    the number of test steps, and a log left behind by a crashed run can still be rendered.
+    """
+    from lxml import etree
+
+    data, ranges = _index_log(log_file)
+
+    # The report without test cases gives the page around them
+    shell = _load_transform()(etree.fromstring(_load_template().render(**data))).getroot()
+    body = shell.find('body')
+    position = body.index(body.find('p[@class="footer"]')) - 1
+
+    with open(log_file, 'rb') as fp, etree.xmlfile(file_name, encoding='utf-8') as xf:
+        with xf.element(shell.tag, shell.attrib):
+            for element in shell:
+                if element is not body:
+                    xf.write(element, pretty_print=True)
+            with xf.element(body.tag, body.attrib):
+                for element in body[:position]:
+                    xf.write(element, pretty_print=True)
+
+                for case_ranges in ranges.values():
+                    group = _read_log_ranges(fp, case_ranges)
+                    case = next(group)
+                    info_table, steps_table, *breaks = _render_chunk([case])
+                    xf.write(info_table, pretty_print=True)
+                    with xf.element(steps_table.tag, steps_table.attrib):
+                        for element in steps_table:
+                            xf.write(element, pretty_print=True)
+                        while True:
+                            steps = list(itertools.islice(group, STREAM_CHUNK))
+                            if not steps:
+                                break
+                            for row in _render_chunk(steps):
+                                xf.write(row, pretty_print=True)
+                    for element in breaks:
+                        xf.write(element, pretty_print=True)
+
+                for element in body[position:]:
+                    xf.write(element, pretty_print=True)
+
+
+class ITestCase(object):
+    """
+    Test Case handle
+
+    Returned by ITestReport.add_test_case(). Steps added through the handle are recorded against
+    this test case, whichever test case was created last, so several test cases can be executed
+    at the same time from different threads.
+    """
+    def __init__(self, report, test_case):
+        self.report = report
+        self.test_case = test_case
+
+    @property
+    def id(self):
+        return self.test_case['ID']
+
+    @property
+    def name(self):
+        return self.test_case['NAME']
+
+    def add_test_step(self, name='', result='OK', comments='', timestamp=None, attachments=None):
+        """ Add test step to this test case. """
+        self.report.add_test_step(name, result, comments, test_case=self, timestamp=timestamp,
+                                  attachments=attachments)
+
+    def add_manual_test_step(self, name='', result='OK', comments=''):
+        """ Add manual test step to this test case. """
+        self.report.add_manual_test_step(name, result, comments, test_case=self)
+
+    def get_summary(self):
+        """ Return the current counters of this test case. """
+        return dict(self.test_case['SUMMARY'])
+
+
+class ResultStore(object):
+    """
+    Result Store
+
+    SQLite database keeping the results of every run: the run information, its test cases and
+    test steps. Test cases and steps are buffered and inserted in batches of STORE_BATCH rows
+    inside one transaction, so recording a step stays cheap.
+
+    Examples:
+        test = ITestReport('Fault Injection Box', '1.0.0', 'r1520', 'Tester', 'Pcan-usb1', db_file='results.db')
+        ...
+        store = ResultStore('results.db')
+        old = store.find_run(revision='r1500')
+        new = store.find_run(revision='r1520')
+        for step in store.flipped_steps(old, new):
+            print(step['TEST_CASE'], step['NAME'], step['OLD_RESULT'], '->', step['NEW_RESULT'])
+        store.load_report(old).gen_report('r1500.html')
+    """
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY, swc_name TEXT, version TEXT, date TEXT,
+            revision TEXT, author TEXT, hw_version TEXT);
+        CREATE TABLE IF NOT EXISTS test_cases (
+            id INTEGER PRIMARY KEY, run_id INTEGER, case_id TEXT, name TEXT, description TEXT,
+            requirement TEXT, initial_conditions TEXT, actions TEXT, eval_criteria TEXT, timestamp REAL);
+        CREATE TABLE IF NOT EXISTS test_steps (
+            id INTEGER PRIMARY KEY, run_id INTEGER, case_id TEXT, case_name TEXT,
+            name TEXT, result TEXT, comments TEXT, timestamp REAL, attachments TEXT);
+        CREATE INDEX IF NOT EXISTS runs_revision ON runs (swc_name, revision);
+        CREATE INDEX IF NOT EXISTS test_cases_run ON test_cases (run_id, case_id);
+        DROP INDEX IF EXISTS test_steps_run;
+        CREATE INDEX IF NOT EXISTS test_steps_step ON test_steps (run_id, case_name, name, id);
+        CREATE INDEX IF NOT EXISTS test_steps_name ON test_steps (case_name, name);
+    '''
+
+    def __init__(self, db_file):
+        import sqlite3
+        self.db = sqlite3.connect(db_file, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(self.SCHEMA)
+        self.lock = threading.Lock()
+        self.pending_cases = []
+        self.pending_steps = []
+
+    def add_run(self, info):
+        """
+        Store a new run.
+
+        @param info: dictionary with swc_name, version, date, revision, author and hw_version
+        @return: run id
+        """
+        with self.lock, self.db:
+            cursor = self.db.execute(
+                'INSERT INTO runs (swc_name, version, date, revision, author, hw_version) VALUES (?, ?, ?, ?, ?, ?)',
+                [info.get(key, '') for key in ('swc_name', 'version', 'date', 'revision', 'author', 'hw_version')])
+            return cursor.lastrowid
+
+    def add_test_case(self, run_id, test_case):
+        """ Buffer a test case of a run. """
+        row = ((run_id, test_case['ID']) + tuple(test_case[key] for key in ITestReport.LOG_FIELDS['TEST_CASE'])
+               + (test_case['TIMESTAMP'],))
+        with self.lock:
+            self.pending_cases.append(row)
+        if len(self.pending_cases) >= STORE_BATCH:
+            self.flush()
+
+    def add_test_step(self, run_id, test_case, test_step):
+        """ Buffer a test step of a run. """
+        attachments = test_step.get('ATTACHMENTS')
+        row = (run_id, test_case['ID'], test_case['NAME'], test_step['NAME'], test_step['RESULT'],
+               test_step['COMMENTS'], test_step['TIMESTAMP'], json.dumps(attachments) if attachments else None)
+        with self.lock:
+            self.pending_steps.append(row)
+        if len(self.pending_steps) >= STORE_BATCH:
+            self.flush()
+
+    def flush(self):
+        """ Insert the buffered test cases and test steps in one transaction. """
+        with self.lock, self.db:
+            self.db.executemany(
+                'INSERT INTO test_cases (run_id, case_id, name, description, requirement, initial_conditions, '
+                'actions, eval_criteria, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', self.pending_cases)
+            self.db.executemany(
+                'INSERT INTO test_steps (run_id, case_id, case_name, name, result, comments, timestamp, attachments) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                self.pending_steps)
+            self.pending_cases = []
+            self.pending_steps = []
+
+    def close(self):
+        """ Flush the buffered rows and close the database. """
+        self.flush()
+        self.db.close()
+
+    def runs(self, swc_name=None):
+        """ Return the stored runs, oldest first, optionally only the ones of a SWC. @return: list of dictionaries """
+        query = 'SELECT * FROM runs'
+        args = []
+        if swc_name is not None:
+            query += ' WHERE swc_name = ?'
+            args.append(swc_name)
+        return [dict(row) for row in self.db.execute(query + ' ORDER BY id', args)]
+
+    def find_run(self, revision, swc_name=None):
+        """ Return the id of the last run of a revision, or None if there is no such run. """
+        query = 'SELECT id FROM runs WHERE revision = ?'
+        args = [revision]
+        if swc_name is not None:
+            query += ' AND swc_name = ?'
+            args.append(swc_name)
+        row = self.db.execute(query + ' ORDER BY id DESC LIMIT 1', args).fetchone()
+        return None if row is None else row['id']
+
+    def flipped_steps(self, old_run, new_run, old_result='OK', new_result='NOK'):
+        """
+        Find the test steps whose result changed between two runs.
+        Steps are matched by test case name, step name and occurrence of that step name inside
+        the test case, so repeated step names are paired one to one and test cases or steps added
+        or removed between the runs do not shift the pairs.
+
+        @return: list of dictionaries with TEST_CASE, NAME, OLD_RESULT, NEW_RESULT and COMMENTS
+        """
+        self.flush()
+        rows = self.db.execute(
+            'WITH steps AS (SELECT *, ROW_NUMBER() OVER (PARTITION BY run_id, case_name, name ORDER BY id) AS position '
+            'FROM test_steps WHERE run_id IN (?, ?)) '
+            'SELECT new.case_name, new.name, old.result, new.result, new.comments '
+            'FROM steps AS new JOIN steps AS old '
+            'ON old.run_id = ? AND old.case_name = new.case_name AND old.name = new.name '
+            'AND old.position = new.position '
+            'WHERE new.run_id = ? AND old.result = ? AND new.result = ? ORDER BY new.id',
+            (old_run, new_run, old_run, new_run, old_result, new_result))
+        return [dict(zip(('TEST_CASE', 'NAME', 'OLD_RESULT', 'NEW_RESULT', 'COMMENTS'), row)) for row in rows]
+
+    def step_history(self, case_name, step_name, swc_name=None):
+        """
+        Return the result of a test step in every stored run, oldest first.
+
+        @return: list of dictionaries with RUN, REVISION, DATE and RESULT
+        """
+        query = ('SELECT runs.id, runs.revision, runs.date, test_steps.result FROM test_steps '
+                 'JOIN runs ON runs.id = test_steps.run_id '
+                 'WHERE test_steps.case_name = ? AND test_steps.name = ?')
+        args = [case_name, step_name]
+        if swc_name is not None:
+            query += ' AND runs.swc_name = ?'
+            args.append(swc_name)
+        rows = self.db.execute(query + ' ORDER BY test_steps.id', args)
+        return [dict(zip(('RUN', 'REVISION', 'DATE', 'RESULT'), row)) for row in rows]
+
+    def load_report(self, run_id, log_file=None):
+        """
+        Rebuild the report of a stored run, e.g. to generate its HTML again.
+
+        @return: ITestReport
+        """
+        self.flush()
+        run = self.db.execute('SELECT * FROM runs WHERE id = ?', (run_id,)).fetchone()
+        report = ITestReport(run['swc_name'], run['version'], run['revision'], run['author'],
+                             run['hw_version'], log_file)
+        report.data_dic['date'] = run['date']
+        if report.log is not None:
+            report._log_record('REPORT', {'date': run['date']})
+
+        handles = {}
+        for row in self.db.execute('SELECT * FROM test_cases WHERE run_id = ? ORDER BY id', (run_id,)):
+            handles[row['case_id']] = report.add_test_case(
+                row['name'], row['description'], row['requirement'], row['initial_conditions'],
+                row['actions'], row['eval_criteria'], row['timestamp'])
+        for row in self.db.execute('SELECT * FROM test_steps WHERE run_id = ? ORDER BY id', (run_id,)):
+            handles[row['case_id']].add_test_step(row['name'], row['result'], row['comments'], row['timestamp'],
+                                                  json.loads(row['attachments']) if row['attachments'] else None)
+        return report
+
 
 class ITestReport(object):
     """
@@ -22,8 +562,31 @@ class ITestReport(object):
 
     This class manages the Integration Test Report, it creates all the required
     methods to create test cases and reporting on HTML.
+
+    When log_file is given the report runs in streaming mode: test cases and test steps are
+    appended to that JSON lines file as they are added instead of being kept in memory, and
+    gen_report() renders the HTML with a streaming pass over the log.
+
+    The summary counters are updated by every test step, so get_summary() and interim
+    gen_report() calls are cheap at any moment of the run.
+
+    Recording is thread-safe. Worker processes can each write their own result log, which are
+    combined afterwards with ITestReport.merge().
+
+    Test steps can carry numeric series (waveforms, sampled variables). They are saved as
+    compressed side-car files in attachment_dir and drawn in the report as small SVG plots.
+
+    When db_file is given the run is also stored in that SQLite ResultStore, to compare it with
+    other runs or generate its HTML again later.
     """
-    def __init__(self, swc='', swc_ver='', revision='', tester='', hw_version=''):
+    # Fields written to the result log for each record type
+    LOG_FIELDS = {
+        'TEST_CASE': ('NAME', 'DESCRIPTION', 'REQUIREMENT', 'INITIAL_CONDITIONS', 'ACTIONS', 'EVAL_CRITERIA'),
+        'TEST_STEP': ('NAME', 'RESULT', 'COMMENTS'),
+    }
+
+    def __init__(self, swc='', swc_ver='', revision='', tester='', hw_version='', log_file=None, db_file=None,
+                 attachment_dir='attachments'):
         self.data_dic = {
             'swc_name': swc,
             'version': swc_ver,
@@ -31,41 +594,141 @@ class ITestReport(object):
             'revision': revision,
             'author': tester,
             'hw_version': hw_version,
-            'summary': defaultdict(int),
+            'summary': _new_summary(),
             'summary_test_cases': [],
             'test_cases': []
         }
+        self.lock = threading.RLock()
+        self.attachment_dir = attachment_dir
+        self.log = None
+        if log_file is not None:
+            self.log = open(log_file, 'w', encoding='utf-8')
+            info = {key: value for key, value in self.data_dic.items() if isinstance(value, str)}
+            self._log_record('REPORT', info)
+        self.store = None
+        if db_file is not None:
+            self.store = ResultStore(db_file)
+            self.run_id = self.store.add_run(self.data_dic)
+
+    def _log_record(self, record_type, record):
+        """ Append a record to the result log, flushed so that it survives a crash. """
+        self.log.write(json.dumps(dict(record, TYPE=record_type)) + '\n')
+        self.log.flush()
+
+    def close(self):
+        """ Close the result log of a streaming report and the result store. """
+        if self.log is not None:
+            self.log.close()
+        if self.store is not None:
+            self.store.close()
 
-    def add_test_case(self, name='', desc='', req='', ini_cond='', action='', eva_criteria=''):
+    def add_test_case(self, name='', desc='', req='', ini_cond='', action='', eva_criteria='', timestamp=None):
         """
         Creating test case. This method populates the required information in the data dictionary.
+
+        @param timestamp: Start time of the test case (seconds since the epoch), now if omitted
+        @return: ITestCase handle to add test steps to this test case
         """
-        test_case = {
-            'NAME': name,
-            'DESCRIPTION': desc,
-            'REQUIREMENT': req,
-            'INITIAL_CONDITIONS': ini_cond,
-            'ACTIONS': action,
-            'EVAL_CRITERIA': eva_criteria,
-            'TEST_STEP': []
-        }
-        self.data_dic['test_cases'].append(test_case)
+        with self.lock:
+            test_case = {
+                'ID': f'test_case_{len(self.data_dic["test_cases"]) + 1}',
+                'NAME': name,
+                'DESCRIPTION': desc,
+                'REQUIREMENT': req,
+                'INITIAL_CONDITIONS': ini_cond,
+                'ACTIONS': action,
+                'EVAL_CRITERIA': eva_criteria,
+                'TIMESTAMP': time.time() if timestamp is None else timestamp,
+                'TEST_STEP': []
+            }
+            test_case['SUMMARY'] = _new_case_summary(test_case)
+            self.data_dic['test_cases'].append(test_case)
+            self.data_dic['summary_test_cases'].append(test_case['SUMMARY'])
+            if self.log is not None:
+                self._log_record('TEST_CASE', {key: test_case[key] for key in ('ID', 'TIMESTAMP') + self.LOG_FIELDS['TEST_CASE']})
+            if self.store is not None:
+                self.store.add_test_case(self.run_id, test_case)
+        return ITestCase(self, test_case)
 
-    def add_test_step( self, name = '', result = 'OK', comments = '' ):
-        """ Add test step to a test case. """
-        ind = len( self.data_dic['test_cases'] )
-        test_case = self.data_dic['test_cases'][0 if ind == 0 else ( ind - 1 )]
+    def add_test_step( self, name = '', result = 'OK', comments = '', test_case = None, timestamp = None,
+                       attachments = None ):
+        """
+        Add test step to a test case.
+
+        @param test_case: ITestCase handle, the last created test case if omitted
+        @param timestamp: End time of the test step (seconds since the epoch), now if omitted
+        @param attachments: Numeric series as a dictionary {label: y values or (x values, y values)},
+                            or a list of attachments already saved by another report. Series must
+                            not be empty and x values must have the same length as y values.
 
+        Examples:
+            test.add_test_step('Output voltage ramp', 'OK', 'Within limits', attachments={'Vout': samples})
+        """
         if result in ['OK', 'NOK', 'NT']:
-            test_case.setdefault( 'TEST_STEP', [] ).append( {
+            test_step = {
                 'NAME': name,
                 'RESULT': result,
-                'COMMENTS': comments
-            } )
+                'COMMENTS': comments,
+                'TIMESTAMP': time.time() if timestamp is None else timestamp
+            }
+            if attachments:
+                test_step['ATTACHMENTS'] = (list(attachments) if isinstance(attachments, list)
+                                            else self._save_attachments(attachments))
+            with self.lock:
+                if test_case is None:
+                    ind = len( self.data_dic['test_cases'] )
+                    test_case = self.data_dic['test_cases'][0 if ind == 0 else ( ind - 1 )]
+                else:
+                    test_case = test_case.test_case
+
+                _count_result(self.data_dic['summary'], test_case['SUMMARY'], result)
+                if self.store is not None:
+                    self.store.add_test_step(self.run_id, test_case, test_step)
+                if self.log is not None:
+                    self._log_record('TEST_STEP', dict(test_step, CASE=test_case['ID']))
+                else:
+                    test_case.setdefault( 'TEST_STEP', [] ).append( test_step )
         else:
             exit( f"Invalid test result ({result}) passed in the this test case -- {name} --.\nUse OK/NOK/NT for the result." )
 
-    def add_manual_test_step(self, name='', result='OK', comments=''):
+    def _save_attachments(self, attachments):
+        """
+        Save numeric series as side-car files.
+
+        @return: list of attachment records
+        @raise ValueError: if a series is empty or its x and y values differ in length
+        """
+        series = {}
+        for label, values in attachments.items():
+            x = None
+            if isinstance(values, tuple) and len(values) == 2 and all(hasattr(v, '__len__') for v in values):
+                x, values = array.array('d', values[0]), values[1]
+            y = array.array('d', values)
+            if not y:
+                raise ValueError(f'Attachment {label} has no samples')
+            if x is not None and len(x) != len(y):
+                raise ValueError(f'Attachment {label} has {len(x)} x values and {len(y)} y values')
+            series[label] = (x, y)
+
+        import uuid
+        os.makedirs(self.attachment_dir, exist_ok=True)
+        records = []
+        for label, (x, y) in series.items():
+            # Unique across reports, worker processes and runs sharing the attachment directory
+            safe_label = re.sub(r'[^\w.-]', '_', str(label))
+            file_name = os.path.join(self.attachment_dir, f'attachment_{uuid.uuid4().hex}_{safe_label}.bin')
+            _write_attachment(file_name, y, x)
+            records.append({
+                'LABEL': str(label),
+                'FILE': file_name,
+                'COUNT': len(y),
+                'MIN': min(y),
+                'MAX': max(y),
+                'SVG': _svg_plot(label, x, y)
+            })
+        return records
+
+    def add_manual_test_step(self, name='', result='OK', comments='', test_case=None):
         cmd = ""
         print(f'Manual test case: {name}')
         while cmd.upper() not in ['OK', 'NOK', 'NT']:
@@ -73,64 +736,279 @@ class ITestReport(object):
 
         comments = input('Enter your comments: ')
 
-        self.add_test_step(name, result, comments)
+        self.add_test_step(name, result, comments, test_case)
 
-    def _build_summary(self):
-        for test_case in self.data_dic['test_cases']:
-            name = test_case['NAME']
-            sub_total_ok = sum(1 for step in test_case['TEST_STEP'] if step['RESULT'] == 'OK')
-            sub_total_nok = sum(1 for step in test_case['TEST_STEP'] if step['RESULT'] == 'NOK')
-            sub_total_nt = sum(1 for step in test_case['TEST_STEP'] if step['RESULT'] not in ['OK', 'NOK'])
+    @classmethod
+    def merge(cls, log_files, log_file=None):
+        """
+        Combine the result logs written by several workers into one report.
 
-            self.data_dic['summary']['TOTAL_RUN_TEST'] += (sub_total_ok + sub_total_nok + sub_total_nt)
-            self.data_dic['summary']['TOTAL_TEST_OK'] += sub_total_ok
-            self.data_dic['summary']['TOTAL_TEST_KO'] += sub_total_nok
-            self.data_dic['summary']['TOTAL_NOT_TESTED'] += sub_total_nt
+        Test cases are added in the order of log_files and, inside each log, in their creation
+        order, with the steps of each test case grouped under it. The report information (SWC,
+        version, revision...) is taken from the first log.
 
-            self.data_dic['summary_test_cases'].append({
-                'NAME': name,
-                'TEST_OK': sub_total_ok,
-                'TEST_KO': sub_total_nok,
-                'NOT_TESTED': sub_total_nt,
-            })
+        @param log_files: list of result logs written with ITestReport(log_file=...)
+        @param log_file: result log of the merged report, kept in memory if omitted
+        @return: ITestReport
+
+        Examples:
+            # worker N
+            test = ITestReport('Fault Injection Box', '1.0.0', '1', 'Tester', 'Bench N', log_file=f'worker_{n}.jsonl')
+            ...
+            # launcher
+            test = ITestReport.merge([f'worker_{n}.jsonl' for n in range(workers)])
+            test.gen_report('unit_test.html')
+        """
+        report = None
+        for partial in log_files:
+            data, ranges = _index_log(partial)
+            if report is None:
+                report = cls(data.get('swc_name', ''), data.get('version', ''), data.get('revision', ''),
+                             data.get('author', ''), data.get('hw_version', ''), log_file)
+                report.data_dic['date'] = data.get('date', report.data_dic['date'])
+                if report.log is not None:
+                    report._log_record('REPORT', {'date': report.data_dic['date']})
+
+            with open(partial, 'rb') as fp:
+                for case_ranges in ranges.values():
+                    records = _read_log_ranges(fp, case_ranges)
+                    case = next(records)
+                    handle = report.add_test_case(*(case[key] for key in cls.LOG_FIELDS['TEST_CASE']),
+                                                  timestamp=case.get('TIMESTAMP'))
+                    for step in records:
+                        handle.add_test_step(step['NAME'], step['RESULT'], step['COMMENTS'], step.get('TIMESTAMP'),
+                                             step.get('ATTACHMENTS'))
+        return report
+
+    def get_summary(self):
+        """
+        Return the current totals of the run.
+
+        @return: dictionary with TOTAL_RUN_TEST, TOTAL_TEST_OK, TOTAL_TEST_KO and TOTAL_NOT_TESTED
+        """
+        return dict(self.data_dic['summary'])
+
+    def get_test_case_summary(self):
+        """
+        Return the current counters of every test case.
+
+        @return: list of dictionaries with ID, NAME, TEST_OK, TEST_KO and NOT_TESTED
+        """
+        return [dict(case_summary) for case_summary in self.data_dic['summary_test_cases']]
 
     def gen_report(self, file_name='report.html'):
-        """ Generate the HTML report combining XML and XSL files """
+        """
+        Generate the HTML report combining XML and XSL files.
 
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        template_path = os.path.join(current_dir, 'template.xml')
+        The template and the style sheet are compiled on the first call and reused afterwards.
+        Summary hyperlinks point to the test case IDs, so no post-processing of the HTML is needed.
+        In streaming mode the HTML is rendered from the result log.
+        """
+        from lxml import etree
 
-        with open(template_path, 'r') as template_file:
-            template_string = template_file.read()
-            template = Template(template_string)
+        if self.store is not None:
+            self.store.flush()
+        if self.log is not None:
+            self.log.flush()
+            gen_report_from_log(self.log.name, file_name)
+            return
 
-        self._build_summary()
+        xml = _load_template().render(**self.data_dic)
+        new_dom = _load_transform()(etree.fromstring(xml))
 
-        xml = template.render(**self.data_dic)
-        xslt = etree.parse(os.path.join(current_dir, 'ITestStyle.xsl'))
+        with open(file_name, "w") as fp:
+            fp.write(etree.tostring(new_dom, pretty_print=True, encoding='unicode'))
 
-        transform = etree.XSLT(xslt)
-        new_dom = transform(etree.fromstring(xml))
+    def _read_results(self):
+        """
+        Return the report data (information and summary, without test cases) and an iterator over
+        the test cases with their TEST_STEP lists, read from the result log in streaming mode.
+        """
+        with self.lock:
+            if self.store is not None:
+                self.store.flush()
+            if self.log is not None:
+                self.log.flush()
+                data, ranges = _index_log(self.log.name)
+                test_cases = _read_log_test_cases(self.log.name, ranges)
+            else:
+                data = self.data_dic
+                test_cases = iter([dict(test_case) for test_case in self.data_dic['test_cases']])
+            data = dict(data, test_cases=[], summary=dict(data['summary']),
+                        summary_test_cases=[dict(case_summary) for case_summary in data['summary_test_cases']])
+        return data, test_cases
 
-        to_file = etree.tostring(new_dom, pretty_print=True, encoding='unicode')
+    def gen_paged_report(self, directory, cases_per_page=1, processes=1):
+        """
+        Generate the HTML report as several files: an index.html page with the report information
+        and the summary, and one page per cases_per_page test cases linked from the summary.
 
-        # Find lines containing 'href="#idm' or 'href="#idp'
-        hyperlink_lines = [line for line in to_file.splitlines() if 'href="#idm' in line or 'href="#idp' in line]
+        Pages are rendered in this process unless processes asks for a pool of worker processes.
+        A pages.json manifest keeps a hash of each page content and of the style sheets, so
+        regenerating the report only rewrites the pages that changed, and all of them after a
+        style change.
 
-        # Find lines containing '<a name="'
-        anchor_lines = [line for line in to_file.splitlines() if '<a name="' in line]
+        Worker processes are started with spawn on Windows, which imports the main script again in
+        every worker: a script using processes other than 1 must call gen_paged_report() under an
+        if __name__ == '__main__': guard.
 
-        # Extract the hyperlink IDs from the lines
-        hyperlink_ids = [re.findall(r'"([^"]*)"', line)[0][1:] for line in hyperlink_lines]
+        @param directory: Output directory, created if needed
+        @param cases_per_page: Number of test cases in each page
+        @param processes: Number of worker processes, None for one per CPU, 1 renders serially
+        @return: list of the page files written (without index.html)
 
-        # Replace the anchor lines with modified content
-        for anchor_line, hyperlink_id in zip(anchor_lines, hyperlink_ids):
-            modified_anchor_line = re.sub(r'".*"', f'"{hyperlink_id}"', anchor_line)
-            to_file = to_file.replace(anchor_line, modified_anchor_line)
+        Examples:
+            if __name__ == '__main__':
+                test = ITestReport(...)
+                ...
+                test.gen_paged_report('report', cases_per_page=10, processes=None)
+        """
+        from lxml import etree
 
-        # Write the modified to_file back to the file
-        with open(file_name, "w") as fp:
-            fp.write(to_file)
+        os.makedirs(directory, exist_ok=True)
+        data, test_cases = self._read_results()
+
+        for number, case_summary in enumerate(data['summary_test_cases']):
+            case_summary['PAGE'] = f'page_{number // cases_per_page + 1:04d}.html'
+
+        index = _load_transform()(etree.fromstring(_load_template().render(**data))).getroot()
+        with open(os.path.join(directory, 'index.html'), 'w', encoding='utf-8') as fp:
+            fp.write(etree.tostring(index, pretty_print=True, encoding='unicode'))
+        head = etree.tostring(index.find('head'))
+
+        manifest_file = os.path.join(directory, 'pages.json')
+        manifest = {}
+        if os.path.exists(manifest_file):
+            with open(manifest_file, 'r') as fp:
+                manifest = json.load(fp)
+
+        jobs = []
+        pages = {}
+        while True:
+            page_cases = list(itertools.islice(test_cases, cases_per_page))
+            if not page_cases:
+                break
+            for test_case in page_cases:
+                test_case.pop('SUMMARY', None)
+            page = f'page_{len(pages) + 1:04d}.html'
+            digest = hashlib.sha1(_style_digest() + head + json.dumps(page_cases, sort_keys=True).encode()).hexdigest()
+            pages[page] = digest
+            if manifest.get(page) != digest or not os.path.exists(os.path.join(directory, page)):
+                jobs.append((os.path.join(directory, page), head, page_cases))
+
+        if processes == 1 or len(jobs) < 2:
+            for job in jobs:
+                _write_page(job)
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(processes) as pool:
+                list(pool.map(_write_page, jobs, chunksize=max(1, len(jobs) // (4 * (processes or os.cpu_count())))))
+
+        for page in set(manifest) - set(pages):
+            if os.path.exists(os.path.join(directory, page)):
+                os.remove(os.path.join(directory, page))
+        with open(manifest_file, 'w') as fp:
+            json.dump(pages, fp, indent=1)
+
+        return [job[0] for job in jobs]
+
+    def gen_junit(self, file_name='report.xml'):
+        """
+        Write the results as JUnit XML without going through the HTML rendering.
+
+        Every test case is a testsuite and every test step a testcase. NOK steps are failures and
+        NT steps are skipped, with the comments as message and output. The time of a step is the
+        time elapsed since the previous step of its test case (or the test case start). The
+        testsuite timestamp attribute is omitted when the test case has no start time.
+        """
+        data, test_cases = self._read_results()
+        summaries = {case_summary['ID']: case_summary for case_summary in data['summary_test_cases']}
+        summary = data['summary']
+        properties = [(key, data[key]) for key in ('version', 'revision', 'author', 'hw_version', 'date')]
+
+        with open(file_name, 'w', encoding='utf-8') as fp:
+            fp.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            fp.write(f'<testsuites name={_quoteattr(str(data["swc_name"]))} tests="{summary["TOTAL_RUN_TEST"]}" '
+                     f'failures="{summary["TOTAL_TEST_KO"]}" skipped="{summary["TOTAL_NOT_TESTED"]}">\n')
+            for test_case in test_cases:
+                case_summary = summaries[test_case['ID']]
+                start = previous = test_case.get('TIMESTAMP')
+                steps = test_case['TEST_STEP']
+                end = steps[-1].get('TIMESTAMP') if steps else start
+                duration = end - start if start is not None and end is not None else 0.0
+                timestamp = ''
+                if start is not None:
+                    timestamp = f' timestamp="{datetime.datetime.fromtimestamp(start).isoformat(timespec="seconds")}"'
+                fp.write(f'  <testsuite id={_quoteattr(test_case["ID"])} name={_quoteattr(str(test_case["NAME"]))} '
+                         f'tests="{len(steps)}" failures="{case_summary["TEST_KO"]}" '
+                         f'skipped="{case_summary["NOT_TESTED"]}" time="{duration:.3f}"{timestamp}>\n')
+                fp.write('    <properties>\n')
+                for key, value in properties + [('requirement', test_case['REQUIREMENT'])]:
+                    fp.write(f'      <property name="{key}" value={_quoteattr(str(value))}/>\n')
+                fp.write('    </properties>\n')
+                for test_step in steps:
+                    current = test_step.get('TIMESTAMP')
+                    elapsed = current - previous if current is not None and previous is not None else 0.0
+                    previous = current
+                    comments = str(test_step['COMMENTS'])
+                    for attachment in test_step.get('ATTACHMENTS', ()):
+                        comments += f'\n[[ATTACHMENT|{os.path.abspath(attachment["FILE"])}]]'
+                    fp.write(f'    <testcase name={_quoteattr(str(test_step["NAME"]))} '
+                             f'classname={_quoteattr(str(test_case["NAME"]))} time="{elapsed:.3f}"')
+                    status = JUNIT_STATUS[test_step['RESULT']]
+                    if status == 'pass' and not comments:
+                        fp.write('/>\n')
+                        continue
+                    fp.write('>\n')
+                    if status == 'fail':
+                        fp.write(f'      <failure message={_quoteattr(comments)}/>\n')
+                    elif status == 'skipped':
+                        fp.write(f'      <skipped message={_quoteattr(comments)}/>\n')
+                    if comments:
+                        fp.write(f'      <system-out>{_escape(comments)}</system-out>\n')
+                    fp.write('    </testcase>\n')
+                fp.write('  </testsuite>\n')
+            fp.write('</testsuites>\n')
+
+    def gen_json(self, file_name='report.json', lines=False):
+        """
+        Write the results as JSON without going through the HTML rendering.
+
+        With lines=False a single JSON document is written: the report information, the summary
+        and the test cases with their steps. With lines=True one JSON object is written per line:
+        a REPORT record, then each TEST_CASE record followed by its TEST_STEP records. Each step
+        carries its RESULT and the matching JUnit STATUS (pass/fail/skipped).
+        """
+        data, test_cases = self._read_results()
+        summaries = {case_summary['ID']: case_summary for case_summary in data['summary_test_cases']}
+        info = {key: value for key, value in data.items() if isinstance(value, str)}
+
+        with open(file_name, 'w', encoding='utf-8') as fp:
+            if lines:
+                fp.write(json.dumps(dict(info, TYPE='REPORT', SUMMARY=data['summary'])) + '\n')
+            else:
+                fp.write(json.dumps(dict(info, summary=data['summary']))[:-1] + ', "test_cases": [')
+
+            for number, test_case in enumerate(test_cases):
+                steps = [dict(test_step, STATUS=JUNIT_STATUS[test_step['RESULT']])
+                         for test_step in test_case.pop('TEST_STEP')]
+                for step in steps:
+                    step.pop('TYPE', None)
+                    step.pop('CASE', None)
+                    if 'ATTACHMENTS' in step:
+                        step['ATTACHMENTS'] = [{key: value for key, value in attachment.items() if key != 'SVG'}
+                                               for attachment in step['ATTACHMENTS']]
+                test_case.pop('TYPE', None)
+                test_case['SUMMARY'] = summaries[test_case['ID']]
+                if lines:
+                    fp.write(json.dumps(dict(test_case, TYPE='TEST_CASE')) + '\n')
+                    for step in steps:
+                        fp.write(json.dumps(dict(step, TYPE='TEST_STEP', CASE=test_case['ID'])) + '\n')
+                else:
+                    fp.write((', ' if number else '') + json.dumps(dict(test_case, TEST_STEP=steps)))
+
+            if not lines:
+                fp.write(']}\n')
 
 if __name__ == "__main__":
     ''' If the script is executed, it will run the report and validate the library '''
@@ -11,13 +11,14 @@ This library is part of ITest framework.
 
 # -------------------- [IMPORTS FILES] ----------------------------------------
 
-from ctypes import CDLL
+from ctypes import CDLL, byref, c_byte, c_char_p, c_int, c_ulong, create_string_buffer
 import sys
 import os
 import array
 import time
 import re
-import subprocess
+import json
+import functools
 
 # Trace32 emulator state
 T32_STATE_DOWN = 0
@@ -30,6 +31,651 @@ BREAKPOINT_TIMEOUT = 6.0
 
 # -------------------- [CONSTANT DEFINITIONS] ---------------------------------
 
+# -------------------- [LAZY IMPORTS] ----------------------------------------
+
+@functools.lru_cache(maxsize=None)
+def _load_rcl():
+    """ Import the Lauterbach RCL package on first use, so T32DebuggerDll users do not need it. """
+    import lauterbach.trace32.rcl as rcl
+    return rcl
+
+
+@functools.lru_cache(maxsize=None)
+def _load_numpy():
+    """ Import NumPy on first use. @return: numpy module, or None if it is not installed. """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class _LazyModule(object):
+    """ Class attribute that resolves to a module loaded on first access. """
+    def __init__(self, loader):
+        self.loader = loader
+
+    def __get__(self, instance, owner):
+        return self.loader()
+
+
+# -------------------- [MEMORY SNAPSHOT] -------------------------------------
+
+# Maximum gap (bytes) between two symbols that still get merged into one block read
+SNAPSHOT_MAX_GAP = 64
+
+# Chunk size used to locate changed bytes when NumPy is not available
+SNAPSHOT_CHUNK = 256
+
+
+class MemorySnapshot(object):
+    """
+    Memory Snapshot
+
+    Holds a copy of one or more target memory blocks as raw bytes together with the symbols
+    that live inside them. Two snapshots of the same layout can be compared with diff(), which
+    reports the changed symbols with their old and new decoded values.
+
+    Comparison is done on the raw buffers: whole blocks and symbols are compared with bytes
+    equality, and when NumPy is installed the changed offsets of a block are found with a single
+    vectorized comparison, so megabyte regions are diffed without Python-level loops over bytes.
+    """
+    def __init__(self, byteorder='little'):
+        self.byteorder = byteorder
+        self.timestamp = time.time()
+        self.blocks = {}
+        self.symbols = {}
+
+    def add_block(self, name, address, data):
+        """
+        Store a memory block in the snapshot.
+
+        @param name: Block name
+        @param address: Start address of the block
+        @param data: Block content as bytes
+        """
+        self.blocks[name] = {'ADDRESS': address, 'DATA': bytes(data)}
+
+    def add_symbol(self, name, block, offset, size):
+        """
+        Register a symbol located inside a block.
+
+        @param name: Symbol name
+        @param block: Name of the block containing the symbol
+        @param offset: Offset of the symbol inside the block
+        @param size: Size of the symbol in bytes
+        """
+        self.symbols[name] = (block, offset, size)
+
+    def raw(self, name):
+        """ Return the raw bytes of a symbol or block. """
+        if name in self.symbols:
+            block, offset, size = self.symbols[name]
+            return self.blocks[block]['DATA'][offset:offset + size]
+        return self.blocks[name]['DATA']
+
+    def value(self, name):
+        """
+        Return the decoded value of a symbol or block.
+
+        @return: integer for 1, 2, 4 or 8 byte symbols, otherwise the raw bytes
+        """
+        return self._decode(self.raw(name))
+
+    def _decode(self, data):
+        if len(data) in (1, 2, 4, 8):
+            return int.from_bytes(data, self.byteorder)
+        return data
+
+    def _changed_offsets(self, old, new):
+        """ Return a sorted list of the offsets where two buffers of the same size differ. """
+        numpy = _load_numpy()
+        if numpy is not None:
+            a = numpy.frombuffer(old, dtype=numpy.uint8)
+            b = numpy.frombuffer(new, dtype=numpy.uint8)
+            return numpy.flatnonzero(a != b)
+
+        offsets = []
+        for start in range(0, len(old), SNAPSHOT_CHUNK):
+            end = start + SNAPSHOT_CHUNK
+            if old[start:end] != new[start:end]:
+                offsets.extend(i for i in range(start, min(end, len(old))) if old[i] != new[i])
+        return offsets
+
+    def _changed_spans(self, old, new):
+        """ Group the changed offsets of two buffers into (offset, size) spans. """
+        numpy = _load_numpy()
+        offsets = self._changed_offsets(old, new)
+        if len(offsets) == 0:
+            return []
+        if numpy is not None:
+            breaks = numpy.flatnonzero(numpy.diff(offsets) != 1) + 1
+            starts = numpy.concatenate(([offsets[0]], offsets[breaks]))
+            ends = numpy.concatenate((offsets[breaks - 1], [offsets[-1]])) + 1
+            return [(int(s), int(e - s)) for s, e in zip(starts, ends)]
+
+        spans = []
+        start = prev = offsets[0]
+        for off in offsets[1:]:
+            if off != prev + 1:
+                spans.append((start, prev - start + 1))
+                start = off
+            prev = off
+        spans.append((start, prev - start + 1))
+        return spans
+
+    def diff(self, other):
+        """
+        Compare this snapshot (old) against another snapshot (new) of the same layout.
+
+        Blocks with registered symbols are reported per symbol. Blocks without symbols are
+        reported as spans of changed bytes named <block>+0x<offset>.
+
+        @param other: Snapshot taken after this one
+        @return: list of dictionaries with NAME, ADDRESS, SIZE, OLD and NEW keys
+        @raise ValueError: if the snapshots do not share the same blocks and block sizes
+
+        Examples:
+            before = t32.take_snapshot(symbols=['Pwm_Duty', 'Pwm_Period'])
+            t32.go()
+            t32.wait_for_breakpoint()
+            after = t32.take_snapshot(symbols=['Pwm_Duty', 'Pwm_Period'])
+            for change in before.diff(after):
+                print(change['NAME'], change['OLD'], '->', change['NEW'])
+        """
+        by_block = {}
+        for name, (block, offset, size) in self.symbols.items():
+            by_block.setdefault(block, []).append((offset, size, name))
+
+        numpy = _load_numpy()
+        changes = []
+        for block_name, block in self.blocks.items():
+            if block_name not in other.blocks:
+                raise ValueError(f'Block {block_name} is missing in the other snapshot, snapshots must share the layout.')
+            old = block['DATA']
+            new = other.blocks[block_name]['DATA']
+            if len(old) != len(new):
+                raise ValueError(f'Block {block_name} has {len(old)} bytes in this snapshot and {len(new)} bytes '
+                                 f'in the other one, snapshots must share the layout.')
+            if old == new:
+                continue
+
+            symbols = sorted(by_block.get(block_name, []))
+            if not symbols:
+                for offset, size in self._changed_spans(old, new):
+                    changes.append({
+                        'NAME': f'{block_name}+0x{offset:X}',
+                        'ADDRESS': block['ADDRESS'] + offset,
+                        'SIZE': size,
+                        'OLD': self._decode(old[offset:offset + size]),
+                        'NEW': self._decode(new[offset:offset + size])
+                    })
+                continue
+
+            if numpy is not None:
+                # Changed byte count of every symbol from a running sum, overlapping symbols
+                # (structures and their members, unions) are each checked on their own range
+                a = numpy.frombuffer(old, dtype=numpy.uint8)
+                b = numpy.frombuffer(new, dtype=numpy.uint8)
+                counts = numpy.concatenate(([0], numpy.cumsum(a != b)))
+                starts = numpy.array([s[0] for s in symbols])
+                ends = starts + numpy.array([s[1] for s in symbols])
+                changed = [symbols[i] for i in numpy.flatnonzero(counts[ends] > counts[starts])]
+            else:
+                changed = [s for s in symbols if old[s[0]:s[0] + s[1]] != new[s[0]:s[0] + s[1]]]
+
+            for offset, size, name in changed:
+                changes.append({
+                    'NAME': name,
+                    'ADDRESS': block['ADDRESS'] + offset,
+                    'SIZE': size,
+                    'OLD': self._decode(old[offset:offset + size]),
+                    'NEW': self._decode(new[offset:offset + size])
+                })
+
+        return sorted(changes, key=lambda change: change['ADDRESS'])
+
+
+# -------------------- [RUNTIME PROFILER] ------------------------------------
+
+# Scale factors of the time units printed by RunTime.ACTUAL()
+RUNTIME_UNITS = {'s': 1.0, 'ms': 1e-3, 'us': 1e-6, 'µs': 1e-6, 'ns': 1e-9}
+
+# Percentiles reported by RuntimeProfile.statistics()
+RUNTIME_PERCENTILES = (50, 90, 95, 99)
+
+
+def parse_runtime(text):
+    """
+    Convert a RunTime.ACTUAL() message into seconds.
+
+    @param text: Message returned by get_runtime_meas(), e.g. '12.500us' or '0.000.012.500s'
+    @return: time in seconds as float
+
+    Examples:
+        parse_runtime('1.250ms')         # 0.00125
+        parse_runtime('0.000.012.500s')  # 1.25e-05
+    """
+    match = re.search(r'(\d+(?:\.\d+)*)\s*(ns|us|µs|ms|s)?\b', text)
+    if match is None:
+        raise ValueError(f'Invalid runtime measurement: {text!r}')
+    integer, *decimals = match.group(1).split('.')
+    value = float(integer + '.' + ''.join(decimals)) if decimals else float(integer)
+    return value * RUNTIME_UNITS[match.group(2) or 's']
+
+
+def _percentile(samples, pct):
+    """ Percentile of sorted samples using linear interpolation between closest ranks. """
+    pos = (len(samples) - 1) * pct / 100.0
+    low = int(pos)
+    high = min(low + 1, len(samples) - 1)
+    return samples[low] + (samples[high] - samples[low]) * (pos - low)
+
+
+class RuntimeProfile(object):
+    """
+    Runtime Profile
+
+    Execution times (in seconds) measured for one span of firmware code, with the statistics
+    and histogram computed from them.
+    """
+    def __init__(self, name, samples=None, timeouts=0):
+        self.name = name
+        self.samples = list(samples or [])
+        self.timeouts = timeouts
+
+    def statistics(self):
+        """
+        Compute the span statistics.
+
+        @return: dictionary with COUNT, TIMEOUTS, MIN, MAX, MEAN, STDEV and P<n> keys (seconds)
+        """
+        samples = sorted(self.samples)
+        stats = {'COUNT': len(samples), 'TIMEOUTS': self.timeouts}
+        if not samples:
+            return stats
+        stats['MIN'] = samples[0]
+        stats['MAX'] = samples[-1]
+        stats['MEAN'] = mean = sum(samples) / len(samples)
+        stats['STDEV'] = (sum((s - mean) ** 2 for s in samples) / len(samples)) ** 0.5
+        for pct in RUNTIME_PERCENTILES:
+            stats[f'P{pct}'] = _percentile(samples, pct)
+        return stats
+
+    def histogram(self, bins=10):
+        """
+        Distribute the samples in equally sized bins.
+
+        @param bins: Number of bins
+        @return: list of (low, high, count) tuples, a single bin when all samples are equal
+        """
+        if not self.samples:
+            return []
+        low, high = min(self.samples), max(self.samples)
+        if low == high:
+            return [(low, high, len(self.samples))]
+        width = (high - low) / bins
+        counts = [0] * bins
+        for sample in self.samples:
+            counts[min(int((sample - low) / width), bins - 1)] += 1
+        return [(low + i * width, low + (i + 1) * width, count) for i, count in enumerate(counts)]
+
+    def summary(self, bins=10):
+        """ Return a multi-line text with the statistics and a text histogram. """
+        stats = self.statistics()
+        if not stats['COUNT']:
+            return f'No samples ({stats["TIMEOUTS"]} timeouts)'
+        lines = [f'Samples: {stats["COUNT"]}  Timeouts: {stats["TIMEOUTS"]}']
+        lines.append('  '.join(f'{key}: {stats[key] * 1e6:.3f}us'
+                               for key in stats if key not in ('COUNT', 'TIMEOUTS')))
+        histogram = self.histogram(bins)
+        peak = max(count for _, _, count in histogram)
+        for low, high, count in histogram:
+            bar = '#' * int(round(20.0 * count / peak))
+            lines.append(f'{low * 1e6:10.3f}-{high * 1e6:10.3f}us {count:6d} {bar}')
+        return '\n'.join(lines)
+
+    def add_to_report(self, report, limit=None, bins=10):
+        """
+        Add the profile as a test step of the current test case of an ITestReport.
+
+        @param report: ITestReport instance
+        @param limit: Maximum allowed execution time in seconds. The step is NOK if any sample
+                      exceeds it, NT if nothing was measured, OK otherwise.
+        @param bins: Number of histogram bins written in the comments
+        """
+        stats = self.statistics()
+        if not stats['COUNT']:
+            result = 'NT'
+        elif limit is not None and stats['MAX'] > limit:
+            result = 'NOK'
+        else:
+            result = 'OK'
+        name = f'Runtime of {self.name}'
+        if limit is not None:
+            name += f' (limit {limit * 1e6:.3f}us)'
+        report.add_test_step(name, result, self.summary(bins))
+
+
+class RuntimeProfiler(object):
+    """
+    Runtime Profiler
+
+    Measures the execution time of firmware code between pairs of breakpoints by running the
+    target through several iterations and reading RunTime.ACTUAL() on each of them.
+
+    A span boundary is either an address (int) or a Trace32 address expression such as a
+    function name (str). profile_function() measures a function from entry to exit. The target
+    is driven through a connected T32 instance.
+
+    Examples:
+        t32 = T32()
+        profiler = RuntimeProfiler(t32, iterations=200)
+        isr = profiler.profile_function('ETPU_Isr')
+        loop = profiler.profile('Control loop', r'\\ctrl\\120', r'\\ctrl\\164')
+        isr.add_to_report(report, limit=15e-6)
+    """
+    def __init__(self, t32, iterations=100, timeout=BREAKPOINT_TIMEOUT):
+        self.t32 = t32
+        self.iterations = iterations
+        self.timeout = timeout
+        self.profiles = {}
+
+    def _set_breakpoint(self, location):
+        if isinstance(location, int):
+            self.t32.set_breakpoint_at_address(location)
+        else:
+            self.t32.set_breakpoint_at_function(location)
+
+    def _clear_breakpoint(self, location):
+        if isinstance(location, int):
+            self.t32.clear_breakpoint_at_address(location)
+        else:
+            self.t32.clear_breakpoint_at_function(location)
+
+    def _run_to(self, location):
+        """ Run the target until the location is reached. @return: False if the timeout expired. """
+        self._set_breakpoint(location)
+        self.t32.go()
+        reached = self.t32.wait_for_breakpoint(self.timeout)
+        self._clear_breakpoint(location)
+        if not reached:
+            self.t32.stop()
+        return reached
+
+    def measure(self, start, end):
+        """
+        Measure one execution of the span.
+
+        @return: execution time in seconds, or None if a breakpoint was not reached
+        """
+        if not self._run_to(start):
+            return None
+        self.t32.reset_runtime()
+        if not self._run_to(end):
+            return None
+        return parse_runtime(self.t32.get_runtime_meas())
+
+    def profile(self, name, start, end, iterations=None):
+        """
+        Measure a span through several iterations.
+
+        @param name: Span name
+        @param start: Address or address expression where the measurement starts
+        @param end: Address or address expression where the measurement ends
+        @param iterations: Number of iterations, defaults to the profiler iterations
+        @return: RuntimeProfile
+        """
+        profile = RuntimeProfile(name)
+        for _ in range(iterations or self.iterations):
+            meas = self.measure(start, end)
+            if meas is None:
+                print(f'[ERROR] Runtime measurement of {name} timed out.')
+                profile.timeouts += 1
+            else:
+                profile.samples.append(meas)
+        self.profiles[name] = profile
+        return profile
+
+    def profile_function(self, function, iterations=None):
+        """ Measure a function from its entry to its exit. @return: RuntimeProfile """
+        return self.profile(function, function, f'sYmbol.EXIT({function})', iterations)
+
+    def profile_spans(self, spans, iterations=None):
+        """
+        Measure several spans.
+
+        @param spans: list of function names and/or (name, start, end) tuples
+        @return: dictionary {name: RuntimeProfile}
+        """
+        profiles = {}
+        for span in spans:
+            if isinstance(span, str):
+                profiles[span] = self.profile_function(span, iterations)
+            else:
+                profiles[span[0]] = self.profile(*span, iterations=iterations)
+        return profiles
+
+
+# -------------------- [REGISTER MAP] ----------------------------------------
+
+# PER.Set / Data access width keyword per register size in bytes
+REGISTER_WIDTHS = {1: 'Byte', 2: 'Word', 4: 'Long', 8: 'Quad'}
+
+# Maximum time (seconds) to wait for a generated PRACTICE script to finish
+PRACTICE_TIMEOUT = 10.0
+
+
+class RegisterMap(object):
+    """
+    Register Map
+
+    Peripheral register definitions (address, width and bit fields) used to configure a
+    peripheral by field name. Changes are staged and written by flush() with the minimum number
+    of memory accesses: fields of the same register are merged into one value and contiguous
+    registers are written with a single write_memory() call.
+
+    Block accesses use access class 0 and let the debugger choose the bus access width. Peripherals
+    that only accept accesses of the register width (e.g. eTPU needs 32-bit accesses) must set an
+    access class. Then every register is accessed with its width (%Byte, %Word, %Long or %Quad)
+    through a generated PRACTICE script run with a single DO command, one script for all the staged
+    writes and one for a read. The script and the read values are exchanged through temporary
+    files, so TRACE32 must run on the same host.
+
+    Register map file (JSON), widths in bits and fields as [lsb, width]:
+        {
+            "ETPU_CR":   {"address": "0xC3FC0000", "width": 32,
+                          "fields": {"GEC": [31, 1], "MDIS": [30, 1], "SCMSIZE": [0, 5]}},
+            "ETPU_CIER": {"address": "0xC3FC0240", "width": 32}
+        }
+
+    Examples:
+        t32 = T32()
+        regs = RegisterMap.from_file(t32, 'etpu_regs.json', byteorder='big', access='ANC')
+        regs.set('ETPU_CR', 'MDIS', 0)
+        regs.set('ETPU_CR', 'SCMSIZE', 0x10)
+        regs.set('ETPU_CIER', value=0x0000FFFF)
+        failed = regs.flush(verify=True)
+    """
+    def __init__(self, t32, registers, byteorder='little', access=None):
+        self.t32 = t32
+        self.byteorder = byteorder
+        self.access = access
+        self.registers = {}
+        for name, reg in registers.items():
+            address = reg['address']
+            self.registers[name] = {
+                'ADDRESS': int(address, 0) if isinstance(address, str) else address,
+                'SIZE': reg.get('width', 32) // 8,
+                'FIELDS': {field: tuple(pos) for field, pos in reg.get('fields', {}).items()}
+            }
+        self.values = {}
+        self.pending = {}
+
+    @classmethod
+    def from_file(cls, t32, filename, byteorder='little', access=None):
+        """ Load the register definitions from a JSON file. @return: RegisterMap """
+        with open(filename, 'r') as fp:
+            return cls(t32, json.load(fp), byteorder, access)
+
+    def _field_mask(self, register, field):
+        if register not in self.registers:
+            raise ValueError(f'Unknown register {register}')
+        reg = self.registers[register]
+        if field is None:
+            return 0, (1 << (8 * reg['SIZE'])) - 1
+        if field not in reg['FIELDS']:
+            raise ValueError(f'Unknown field {field} in register {register}, '
+                             f'known fields: {", ".join(reg["FIELDS"]) or "none"}')
+        lsb, width = reg['FIELDS'][field]
+        return lsb, ((1 << width) - 1) << lsb
+
+    def set(self, register, field=None, value=0):
+        """
+        Stage a register or field value. Nothing is written until flush() is called.
+
+        @param register: Register name
+        @param field: Field name, if omitted the whole register is set
+        @param value: Register or field value
+        @raise ValueError: unknown register or field, or value does not fit in the field
+        """
+        lsb, mask = self._field_mask(register, field)
+        if not 0 <= value <= mask >> lsb:
+            raise ValueError(f'Value {hex(value)} out of range for {register}{"." + field if field else ""}, '
+                             f'allowed 0x0-0x{mask >> lsb:X}')
+        old_mask, old_value = self.pending.get(register, (0, 0))
+        self.pending[register] = (old_mask | mask, (old_value & ~mask) | ((value << lsb) & mask))
+
+    def set_fields(self, register, **fields):
+        """ Stage several fields of a register, e.g. set_fields('ETPU_CR', MDIS=0, GEC=1). """
+        for field, value in fields.items():
+            self.set(register, field, value)
+
+    def get(self, register, field=None):
+        """
+        Return the last value read or written of a register or field.
+
+        @return: integer value, or None if the register was never read or written
+        """
+        if register not in self.values:
+            return None
+        lsb, mask = self._field_mask(register, field)
+        return (self.values[register] & mask) >> lsb
+
+    def _runs(self, names):
+        """ Group registers into runs of contiguous addresses. @return: list of lists of names """
+        runs = []
+        end = None
+        for name in sorted(names, key=lambda n: self.registers[n]['ADDRESS']):
+            reg = self.registers[name]
+            if runs and reg['ADDRESS'] == end:
+                runs[-1].append(name)
+            else:
+                runs.append([name])
+            end = reg['ADDRESS'] + reg['SIZE']
+        return runs
+
+    def _run_script(self, lines):
+        """ Run PRACTICE commands as one script with a single DO and wait until it has finished. """
+        import tempfile
+        fd, script = tempfile.mkstemp(suffix='.cmm')
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write('\n'.join(lines + ['ENDDO']) + '\n')
+            self.t32.cmd(f'DO "{script}"')
+            start_time = time.time()
+            while self.t32.get_cmd_state() != 0:
+                if time.time() - start_time > PRACTICE_TIMEOUT:
+                    raise TimeoutError(f'PRACTICE script {script} did not finish in {PRACTICE_TIMEOUT} s')
+                time.sleep(0.01)
+        finally:
+            os.remove(script)
+
+    def read(self, registers=None):
+        """
+        Read registers from the target with one memory read per contiguous run, or one PRACTICE
+        script when an access class is set.
+
+        @param registers: list of register names, all registers if omitted
+        @return: dictionary {register: value}
+        """
+        values = {}
+        if self.access is not None:
+            import tempfile
+            names = list(registers if registers is not None else self.registers)
+            fd, out_file = tempfile.mkstemp(suffix='.txt')
+            os.close(fd)
+            try:
+                lines = [f'OPEN #1 "{out_file}" /Create']
+                for name in names:
+                    reg = self.registers[name]
+                    lines.append(f'WRITE #1 FORMAT.HEX({2 * reg["SIZE"]},'
+                                 f'Data.{REGISTER_WIDTHS[reg["SIZE"]]}({self.access}:0x{reg["ADDRESS"]:X}))')
+                lines.append('CLOSE #1')
+                self._run_script(lines)
+                with open(out_file, 'r') as fp:
+                    for name, line in zip(names, fp.read().split()):
+                        values[name] = int(line, 16)
+            finally:
+                os.remove(out_file)
+            self.values.update(values)
+            return values
+
+        for run in self._runs(registers if registers is not None else self.registers):
+            start = self.registers[run[0]]['ADDRESS']
+            last = self.registers[run[-1]]
+            data = self.t32.read_memory_bytes(start, last['ADDRESS'] + last['SIZE'] - start)
+            for name in run:
+                reg = self.registers[name]
+                offset = reg['ADDRESS'] - start
+                values[name] = int.from_bytes(data[offset:offset + reg['SIZE']], self.byteorder)
+        self.values.update(values)
+        return values
+
+    def flush(self, verify=False):
+        """
+        Write all staged changes to the target.
+
+        Registers where only some fields were set are read first (read-modify-write), unless
+        their value is already known.
+
+        @param verify: Read back the written registers and compare the staged bits, other bits
+                       (read-only, status or write-1-to-clear) are not checked
+        @return: list of register names whose read-back value does not match (empty if OK)
+        """
+        partial = [name for name, (mask, _) in self.pending.items()
+                   if mask != self._field_mask(name, None)[1] and name not in self.values]
+        if partial:
+            self.read(partial)
+
+        written = {}
+        for name, (mask, value) in self.pending.items():
+            written[name] = (self.values.get(name, 0) & ~mask) | value
+
+        if self.access is not None:
+            self._run_script([f'PER.Set.simple {self.access}:0x{self.registers[name]["ADDRESS"]:X} '
+                              f'%{REGISTER_WIDTHS[self.registers[name]["SIZE"]]} 0x{written[name]:X}'
+                              for name in sorted(written, key=lambda n: self.registers[n]['ADDRESS'])])
+        else:
+            for run in self._runs(written):
+                data = b''.join(written[name].to_bytes(self.registers[name]['SIZE'], self.byteorder)
+                                for name in run)
+                self.t32.write_memory(self.registers[run[0]]['ADDRESS'], data)
+
+        staged = self.pending
+        self.values.update(written)
+        self.pending = {}
+
+        if not verify:
+            return []
+        read_back = self.read(list(written))
+        failed = [name for name in written if (read_back[name] ^ written[name]) & staged[name][0]]
+        for name in failed:
+            print(f'[ERROR] Register {name} verification failed: '
+                  f'wrote 0x{written[name]:X}, read 0x{read_back[name]:X} (mask 0x{staged[name][0]:X})')
+        return failed
+
+
 class T32Legacy(object):
 
     def __init__(self, port_c1='20000'):
@@ -41,7 +687,7 @@ class T32DebuggerDll (object):
         """ Constructor. Loads t32lib.dll library and establishes connection with TRACE32. """
         try:
             self.t32lib = CDLL('t32api64.dll')
-        except WindowsError:
+        except OSError:
             print("[ERROR] Failed to load t64api.dll\n")
             print("[ERROR] Are you using python 64bit installation?")
             sys.exit()
@@ -67,10 +713,10 @@ class T32DebuggerDll (object):
 
     def _init_trace32(self):
         """ Initialize the driver and TRACE32 connection. @return: 0 if initialization was successful. """
-        if self.t32lib.T32_Init() != 0:
+        result = self.t32lib.T32_Init()
+        if result != 0:
             print("Failed to initialize connection with Trace32.")
-            return False
-        return True
+        return result
 
     def attach(self):
         """ Attach to the running TRACE32 instance. @return: 0 if attach was successful. """
@@ -119,11 +765,29 @@ class T32DebuggerDll (object):
         self.t32lib.T32_GetPracticeState(byref(result))
         return result.value
 
+    def get_state(self):
+        """
+        Returns the state of the debugger and the target: T32_STATE_DOWN, T32_STATE_HALTED, T32_STATE_STOPPED
+        or T32_STATE_RUNNING.
+
+        @return: state value, T32_STATE_DOWN if the state could not be read
+        """
+        state = c_int(T32_STATE_DOWN)
+        if self.t32lib.T32_GetState(byref(state)) != 0:
+            return T32_STATE_DOWN
+        return state.value
 
-class T32(object):
-    import lauterbach.trace32.rcl as t32
 
+class T32(T32DebuggerDll):
+    """
+    Trace32 debugger API: memory, breakpoints, execution control and variables on top of the
+    TRACE32 connection (commands, messages, runtime and state) of T32DebuggerDll.
+    """
+    t32 = _LazyModule(_load_rcl)
 
+    def __init__(self, port_c1='20000'):
+        super().__init__(port_c1)
+        self.vars_list = []
 
     def reset_cpu(self):
         """
@@ -140,14 +804,76 @@ class T32(object):
 
         @return: list in bytes of the memory content
         """
+        s = array.array('B')
+        s.frombytes(self.read_memory_bytes(address, size))
+        return s.tolist()
+
+    def read_memory_bytes(self, address, size):
+        """
+        Reads data from target memory without converting it to a list.
+
+        @return: bytes with the memory content
+        """
         add = c_ulong(address)
         acc = c_int(0x00)
         buf = create_string_buffer(size)
         siz = c_int(size)
         self.t32lib.T32_ReadMemory(add, acc, buf, siz)
-        s = array.array('B')
-        s.frombytes(buf.raw)
-        return s.tolist()
+        return buf.raw
+
+    def take_snapshot(self, regions=None, symbols=None, byteorder='little', max_gap=SNAPSHOT_MAX_GAP):
+        """
+        Captures named memory regions and/or symbols into a MemorySnapshot.
+
+        Symbols are sorted by address and neighbouring symbols (closer than max_gap bytes) are
+        merged into a single block, so a whole symbol map is captured with few memory reads.
+
+        @param regions: dictionary {name: (address, size)} of raw memory regions
+        @param symbols: list of symbol names resolved through Trace32, or a symbol map
+                        dictionary {name: (address, size)}
+        @param byteorder: 'little' or 'big', used to decode the symbol values
+        @param max_gap: maximum number of bytes between two symbols to read them in one block
+        @return: MemorySnapshot
+
+        Examples:
+            t32 = T32()
+            before = t32.take_snapshot(regions={'RAM': (0x40000000, 0x80000)})
+            ...
+            after = t32.take_snapshot(regions={'RAM': (0x40000000, 0x80000)})
+            changes = before.diff(after)
+        """
+        snapshot = MemorySnapshot(byteorder)
+
+        for name, (address, size) in (regions or {}).items():
+            snapshot.add_block(name, address, self.read_memory_bytes(address, size))
+
+        if symbols is None:
+            return snapshot
+        if not isinstance(symbols, dict):
+            symbols = {sym: (self.get_symbol_address(sym), self.get_symbol_size(sym)) for sym in symbols}
+
+        group = []
+        for name, (address, size) in sorted(symbols.items(), key=lambda item: item[1][0]):
+            if group and address > group_end + max_gap:
+                self._snapshot_symbols(snapshot, group)
+                group = []
+            if not group:
+                group_end = address
+            group.append((name, address, size))
+            group_end = max(group_end, address + size)
+        if group:
+            self._snapshot_symbols(snapshot, group)
+
+        return snapshot
+
+    def _snapshot_symbols(self, snapshot, group):
+        """ Reads a group of neighbouring symbols as one block and registers them in the snapshot. """
+        start = group[0][1]
+        end = max(address + size for _, address, size in group)
+        block = f'0x{start:08X}'
+        snapshot.add_block(block, start, self.read_memory_bytes(start, end - start))
+        for name, address, size in group:
+            snapshot.add_symbol(name, block, address - start, size)
 
     def write_memory(self, address, data):
         """
@@ -572,16 +1298,17 @@ class T32(object):
             self.cmd('var.addwatch ' + var)
         self.cmd('V ' + var + ' = ' + str(value))
 
-    def write_per_register(self,addr,datatype,value):
+    def write_per_register(self,addr,datatype,value,access='ANC'):
         """
         @param addr: Address of register(hex value) as string
         @param datatype: enter register data type among Byte,Word and Long as string
         @param value: value to be written to register. enter hex value
+        @param access: memory access class
         """
         addr=str(addr)
         datatype=str(datatype)
         value=str(value)
-        command='PER.Set.simple ANC:'+addr+ ' %'+ datatype+ ' '+value
+        command='PER.Set.simple '+access+':'+addr+ ' %'+ datatype+ ' '+value
         self.cmd(command)
 
     def wait_for_breakpoint(self, timeout=BREAKPOINT_TIMEOUT):
@@ -659,7 +1386,7 @@ class T32(object):
 if __name__ == "__main__":
     ''' If the script is executed, it will run the report and validate the library '''
 
-    dbg = t32.connect(node='localhost', port=20000, protocol="TCP", timeout=10.0)
+    dbg = T32.t32.connect(node='localhost', port=20000, protocol="TCP", timeout=10.0)
 
     print (dbg)
 